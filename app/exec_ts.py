@@ -2,12 +2,17 @@ import asyncio
 import os
 import tempfile
 
-from .resource_monitor import ResourceStats, monitor_process_resources
+from .node_pool import ts_node_pool
+from .resource_monitor import ResourceStats, resource_sampler
+from .utils import communicate_capped, kill_process_group, node_env
 
 
 async def execute_code(
     code: str, timeout: float, memory_limit: int | None = None
 ) -> tuple[bool, str, ResourceStats]:
+    if ts_node_pool.enabled and memory_limit == ts_node_pool.memory_limit:
+        return await ts_node_pool.execute(code, timeout)
+
     file_path = None
     stats = ResourceStats()
     try:
@@ -16,54 +21,50 @@ async def execute_code(
         ) as tmp_f:
             file_path = tmp_f.name
             tmp_f.write(code)
-            tmp_f.flush()
 
-            cmd = ["ts-node", "--compiler-options", '{"module": "commonjs"}', file_path]
+        cmd = ["ts-node", "--compiler-options", '{"module": "commonjs"}', file_path]
+
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=node_env(memory_limit),
+            # own process group, so that processes started by the sample are
+            # killed with it
+            start_new_session=True,
+        )
 
-            env = os.environ.copy()
-            if memory_limit:
-                # memory_limit is in MB
-                env["NODE_OPTIONS"] = f"--max-old-space-size={memory_limit}"
+        # Start resource monitoring (only if pid is available)
+        if proc.pid is not None:
+            stats = resource_sampler.register(proc.pid)
 
-            proc = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                env=env,
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                communicate_capped(proc, b""), timeout=timeout
             )
+            if stdout is None or stderr is None:
+                return False, "failed: output limit exceeded", stats
+            stdout_str = stdout.decode().strip()
+            stderr_str = stderr.decode().strip()
 
-            # Start resource monitoring (only if pid is available)
-            if proc.pid is not None:
-                stats, stop_event = await monitor_process_resources(proc.pid)
+            if proc.returncode == 0:
+                return True, stdout_str, stats
             else:
-                # This should rarely happen with subprocess, but handle it gracefully
-                stop_event = asyncio.Event()
-                stop_event.set()  # Already "stopped" since we never started
-
-            try:
-                stdout, stderr = await asyncio.wait_for(
-                    proc.communicate(), timeout=timeout
+                return (
+                    False,
+                    f"failed [exit {proc.returncode}]: {stderr_str}",
+                    stats,
                 )
-                stdout_str = stdout.decode().strip()
-                stderr_str = stderr.decode().strip()
-
-                if proc.returncode == 0:
-                    return True, stdout_str, stats
-                else:
-                    return (
-                        False,
-                        f"failed [exit {proc.returncode}]: {stderr_str}",
-                        stats,
-                    )
-            except asyncio.TimeoutError:
-                proc.kill()
-                await proc.wait()
-                return False, "failed: timeout", stats
-            finally:
-                # Stop monitoring
-                stop_event.set()
-                await asyncio.sleep(0.1)  # Give monitor time to finish
+        except asyncio.TimeoutError:
+            kill_process_group(proc)
+            await proc.wait()
+            return False, "failed: timeout", stats
+        finally:
+            # Stop monitoring
+            resource_sampler.unregister(proc.pid)
+            # processes the sample left running in the background
+            kill_process_group(proc)
     except Exception as e:
         return False, f"failed: [{type(e).__name__}] {e}", stats
     finally:
@@ -0,0 +1,425 @@
+import asyncio
+import json
+import os
+import struct
+
+from loguru import logger
+
+from .resource_monitor import ResourceStats, resource_sampler
+from .utils import MAX_OUTPUT_BYTES, kill_process_group, node_env
+
+# Runs inside every pooled node process: reads framed jobs from stdin, runs the
+# code like a CommonJS script and answers with a framed JSON result. A job is
+# a header of two big-endian uint32 (code length in bytes, timeout in ms)
+# followed by the UTF-8 code, a result is a uint32 length and the JSON.
+# It is started with the output limit in bytes as first argument; with
+# "typescript" as second, jobs are compiled with ts-node first.
+_DISPATCHER = r"""
+const path = require("path");
+const util = require("util");
+const vm = require("vm");
+const { Console } = require("console");
+const { createRequire } = require("module");
+const { Writable } = require("stream");
+
+const userRequire = createRequire(process.cwd() + "/");
+// opened up front, so that their pipes are not mistaken for work left by a job
+const output = process.stdout;
+process.stderr;
+
+const reply = (result) => {
+  const body = Buffer.from(JSON.stringify(result));
+  const header = Buffer.alloc(4);
+  header.writeUInt32BE(body.length);
+  output.write(Buffer.concat([header, body]));
+};
+
+const typescriptCompiler = () => {
+  let tsNode;
+  try {
+    tsNode = require("ts-node");
+  } catch {
+    // installed globally (npm install -g), next to the node binary
+    const prefix = path.dirname(path.dirname(process.execPath));
+    tsNode = require(path.join(prefix, "lib", "node_modules", "ts-node"));
+  }
+  const service = tsNode.create({ compilerOptions: { module: "commonjs" } });
+  const fileName = path.join(process.cwd(), "[stdin].ts");
+  const compile = (code) => service.compile(code, fileName);
+  // load the compiler and the lib typings now instead of on the first job
+  compile("");
+  return compile;
+};
+
+const outputLimit = Number(process.argv[1]);
+const typescript = process.argv[2] === "typescript";
+const transform = typescript ? typescriptCompiler() : (code) => code;
+const filename = typescript ? "[stdin].ts" : "[stdin]";
+
+// node's own globals (timers, Buffer, URL, ...) for the context of each job,
+// the JavaScript builtins are created fresh with every context. Functions of
+// this script are bound with const, declared ones would be globals as well.
+const contextBuiltins = new Set(
+  vm.runInNewContext("Object.getOwnPropertyNames(globalThis)"),
+);
+const perJob = new Set([
+  ...require("module").builtinModules,
+  "global", "process", "console", "require", "module", "exports",
+  "__filename", "__dirname",
+]);
+const nodeGlobals = Object.getOwnPropertyNames(globalThis)
+  .filter((name) => !contextBuiltins.has(name) && !perJob.has(name))
+  .map((name) => {
+    const descriptor = Object.getOwnPropertyDescriptor(globalThis, name);
+    // lazily loaded ones are resolved, so that jobs see the shared objects
+    if (!descriptor.get) return [name, descriptor];
+    const { enumerable, configurable } = descriptor;
+    return [name, { value: globalThis[name], writable: true, enumerable, configurable }];
+  });
+
+// state of the worker's real process, restored after every job
+const initialCwd = process.cwd();
+const initialEnv = { ...process.env };
+
+const restoreProcess = () => {
+  process.exitCode = undefined;
+  if (process.cwd() !== initialCwd) process.chdir(initialCwd);
+  for (const key of Object.keys(process.env)) {
+    if (!(key in initialEnv)) delete process.env[key];
+  }
+  for (const [key, value] of Object.entries(initialEnv)) {
+    if (process.env[key] !== value) process.env[key] = value;
+  }
+};
+
+const countListeners = () =>
+  process.eventNames().reduce((n, name) => n + process.listenerCount(name), 0);
+
+// Objects shared by all jobs of a worker (node's globals, required modules)
+// can't be reset, a job which changed one of their properties gets its
+// worker replaced. Nested objects and prototypes are not compared.
+const track = (shared, value) => {
+  if (value === null || (typeof value !== "object" && typeof value !== "function")) {
+    return;
+  }
+  if (shared.has(value)) return;
+  shared.set(
+    value,
+    Reflect.ownKeys(value).map((key) => [key, Object.getOwnPropertyDescriptor(value, key)]),
+  );
+};
+
+const sharedModified = (shared) => {
+  for (const [value, properties] of shared) {
+    if (Reflect.ownKeys(value).length !== properties.length) return true;
+    for (const [key, before] of properties) {
+      const after = Object.getOwnPropertyDescriptor(value, key);
+      if (
+        !after ||
+        after.value !== before.value ||
+        after.get !== before.get ||
+        after.set !== before.set
+      ) {
+        return true;
+      }
+    }
+  }
+  return false;
+};
+
+class ExitSignal {
+  constructor(code) {
+    this.code = code;
+  }
+}
+
+class OutputLimitSignal {}
+
+let current = null;
+const fail = (error) => {
+  if (current && current.error === undefined) current.error = error;
+};
+process.on("uncaughtException", fail);
+process.on("unhandledRejection", fail);
+
+// like piping a fresh node's output, each stream may hold `outputLimit` bytes
+const capture = (job) => {
+  const chunks = [];
+  let size = 0;
+  const stream = new Writable();
+  stream.write = (chunk, encoding, callback) => {
+    size += Buffer.byteLength(chunk, typeof encoding === "string" ? encoding : undefined);
+    if (size > outputLimit) {
+      job.outputLimitExceeded = true;
+      throw new OutputLimitSignal();
+    }
+    chunks.push(chunk.toString());
+    callback = typeof encoding === "function" ? encoding : callback;
+    if (typeof callback === "function") process.nextTick(callback);
+    return true;
+  };
+  return [stream, chunks];
+};
+
+const countResources = () => {
+  const counts = new Map();
+  for (const name of process.getActiveResourcesInfo()) {
+    counts.set(name, (counts.get(name) || 0) + 1);
+  }
+  return counts;
+};
+
+// timers, I/O or child processes started by the job and still active
+const hasPending = (before) => {
+  for (const [name, count] of countResources()) {
+    if (count > (before.get(name) || 0)) return true;
+  }
+  return false;
+};
+
+const run = async ({ code, timeout }) => {
+  const deadline = Date.now() + timeout;
+  const before = countResources();
+  const listeners = countListeners();
+  const shared = new Map();
+  for (const [, descriptor] of nodeGlobals) track(shared, descriptor.value);
+  const job = { error: undefined, outputLimitExceeded: false };
+  const [out, stdout] = capture(job);
+  const [err, stderr] = capture(job);
+  // process state a job may set is kept on its own object, the rest (env,
+  // cwd, listeners) reaches the real process and is reset or checked below
+  const sandboxProcess = Object.create(process, {
+    stdout: { value: out },
+    stderr: { value: err },
+    argv: { value: [process.execPath, "-"], writable: true, enumerable: true },
+    exitCode: { value: undefined, writable: true, enumerable: true },
+    exit: {
+      value: (exitCode = sandboxProcess.exitCode || 0) => {
+        throw new ExitSignal(exitCode);
+      },
+    },
+  });
+  const module = { exports: {}, id: filename, filename, loaded: false };
+  const sandbox = {};
+  for (const [name, descriptor] of nodeGlobals) {
+    Object.defineProperty(sandbox, name, descriptor);
+  }
+  Object.assign(sandbox, {
+    process: sandboxProcess,
+    console: new Console({ stdout: out, stderr: err, ignoreErrors: false }),
+    // the real process writes to the pipe the results go back through
+    require: Object.assign((id) => {
+      if (id === "process" || id === "node:process") return sandboxProcess;
+      const exported = userRequire(id);
+      track(shared, exported);
+      return exported;
+    }, userRequire),
+    module,
+    exports: module.exports,
+    __filename: filename,
+    __dirname: ".",
+  });
+  const context = vm.createContext(sandbox);
+  sandbox.global = vm.runInContext("globalThis", context);
+
+  current = job;
+  let exitCode = 0;
+  let timedOut = false;
+  try {
+    // a fresh context, so that globals of one job are not seen by the next
+    vm.runInContext(transform(code), context, { filename, timeout });
+    // like a fresh node, wait for what the job left running, unless it failed
+    await new Promise(setImmediate);
+    while (job.error === undefined && hasPending(before)) {
+      if (Date.now() >= deadline) {
+        timedOut = true;
+        break;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 5));
+    }
+    if (job.error !== undefined) throw job.error;
+    exitCode = sandboxProcess.exitCode || 0;
+  } catch (error) {
+    if (error instanceof ExitSignal) {
+      exitCode = error.code;
+    } else if (error && error.code === "ERR_SCRIPT_EXECUTION_TIMEOUT") {
+      timedOut = true;
+    } else if (!(error instanceof OutputLimitSignal)) {
+      exitCode = 1;
+      stderr.push(util.inspect(error) + "\n");
+    }
+  } finally {
+    current = null;
+    restoreProcess();
+  }
+  reply({
+    exitCode,
+    timedOut,
+    outputLimitExceeded: job.outputLimitExceeded,
+    // work still running or changed shared state would reach the next job
+    recycle:
+      hasPending(before) ||
+      countListeners() !== listeners ||
+      sharedModified(shared),
+    stdout: stdout.join(""),
+    stderr: stderr.join(""),
+  });
+};
+
+let queue = Promise.resolve();
+let pending = Buffer.alloc(0);
+process.stdin.on("data", (chunk) => {
+  pending = pending.length ? Buffer.concat([pending, chunk]) : chunk;
+  while (pending.length >= 8) {
+    const size = pending.readUInt32BE(0);
+    if (pending.length < 8 + size) break;
+    const job = {
+      timeout: pending.readUInt32BE(4),
+      code: pending.toString("utf8", 8, 8 + size),
+    };
+    pending = pending.subarray(8 + size);
+    queue = queue.then(() => run(job));
+  }
+});
+"""
+
+_JOB_HEADER = struct.Struct(">II")
+_REPLY_HEADER = struct.Struct(">I")
+# replies carry up to MAX_OUTPUT_BYTES of stdout and of stderr, which JSON
+# escaping ("\u0000") can grow six-fold; larger ones are treated as broken
+_MAX_REPLY = 2 * 6 * MAX_OUTPUT_BYTES + 64 * 1024
+# samples are stopped by node itself after `timeout`, workers which do not
+# answer within this extra time are killed
+_KILL_GRACE = 0.5
+
+
+class NodePool:
+    """
+    Keeps warm `node` processes which run JavaScript samples one after the
+    other, so that a sample does not pay node's start-up time. With
+    `typescript`, samples are type-checked and compiled by a ts-node service
+    which stays loaded in the worker as well.
+
+    Each sample runs as a CommonJS script in a fresh context of its worker:
+    pending timers and I/O are waited for until the timeout, and output is
+    capped at `MAX_OUTPUT_BYTES`. Values created by node's built-in modules
+    come from the worker's main context. The exit code, environment and
+    working directory of the worker are reset after each sample. A worker is
+    replaced after a timeout, when it dies, when a sample left work running
+    in it, added process listeners or changed a property of node's globals or
+    of a required module. Deeper changes (e.g. to `Buffer.prototype`) are not
+    noticed and reach the next samples of the worker, so grading is not
+    guaranteed to match a fresh `node -`.
+    """
+
+    def __init__(self, size: int, memory_limit: int, typescript: bool = False):
+        self.size = size
+        self.memory_limit = memory_limit
+        self.typescript = typescript
+        self._idle: asyncio.Queue[asyncio.subprocess.Process] | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    async def start(self):
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            self._idle.put_nowait(await self._spawn())
+
+    async def close(self):
+        while self._idle is not None and not self._idle.empty():
+            proc = self._idle.get_nowait()
+            kill_process_group(proc)
+            await proc.wait()
+        self._idle = None
+
+    async def execute(
+        self, code: str, timeout: float
+    ) -> tuple[bool, str, ResourceStats]:
+        await self.start()
+        assert self._idle is not None
+        proc = await self._idle.get()
+        pid = proc.pid
+        stats = resource_sampler.register(pid)
+        data = code.encode()
+        try:
+            assert proc.stdin is not None and proc.stdout is not None
+            proc.stdin.write(
+                _JOB_HEADER.pack(len(data), max(1, int(timeout * 1000))) + data
+            )
+            await proc.stdin.drain()
+            result = json.loads(
+                await asyncio.wait_for(
+                    _read_reply(proc.stdout), timeout=timeout + _KILL_GRACE
+                )
+            )
+            if result["recycle"]:
+                # the sample left timers, I/O or processes running in the worker
+                proc = await self._replace(proc)
+        except asyncio.TimeoutError:
+            proc = await self._replace(proc)
+            return False, "failed: timeout", stats
+        except Exception as e:
+            proc = await self._replace(proc)
+            return False, f"failed: [{type(e).__name__}] {e}", stats
+        finally:
+            resource_sampler.unregister(pid)
+            self._idle.put_nowait(proc)
+
+        if result["outputLimitExceeded"]:
+            return False, "failed: output limit exceeded", stats
+        if result["timedOut"]:
+            return False, "failed: timeout", stats
+        if result["exitCode"] == 0:
+            return True, result["stdout"].strip(), stats
+        return (
+            False,
+            f"failed [exit {result['exitCode']}]: {result['stderr'].strip()}",
+            stats,
+        )
+
+    async def _spawn(self) -> asyncio.subprocess.Process:
+        return await asyncio.create_subprocess_exec(
+            "node",
+            "-e",
+            _DISPATCHER,
+            str(MAX_OUTPUT_BYTES),
+            *(["typescript"] if self.typescript else []),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            env=node_env(self.memory_limit),
+            # processes started by samples are killed with the worker
+            start_new_session=True,
+        )
+
+    async def _replace(
+        self, proc: asyncio.subprocess.Process
+    ) -> asyncio.subprocess.Process:
+        kill_process_group(proc)
+        await proc.wait()
+        logger.debug(f"replacing node worker {proc.pid} (exit {proc.returncode})")
+        return await self._spawn()
+
+
+async def _read_reply(reader: asyncio.StreamReader) -> bytes:
+    try:
+        (size,) = _REPLY_HEADER.unpack(await reader.readexactly(_REPLY_HEADER.size))
+        if size > _MAX_REPLY:
+            raise ValueError(f"reply of {size} bytes from node worker")
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        raise EOFError("node worker exited") from None
+
+
+node_pool = NodePool(
+    size=int(os.getenv("NODE_POOL_SIZE", "0")),
+    memory_limit=int(os.getenv("NODE_POOL_MEMORY_LIMIT", "1024")),
+)
+ts_node_pool = NodePool(
+    size=int(os.getenv("TS_NODE_POOL_SIZE", "0")),
+    memory_limit=int(os.getenv("TS_NODE_POOL_MEMORY_LIMIT", "1024")),
+    typescript=True,
+)
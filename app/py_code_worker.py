@@ -0,0 +1,257 @@
+"""
+Sandboxed execution of python code, run inside the pooled runner processes.
+Only the standard library is imported here, to keep runner start-up short.
+"""
+
+import contextlib
+import faulthandler
+import functools
+import io
+import os
+import resource
+import shutil
+import sys
+import tempfile
+from typing import Callable
+
+
+def run_code(code: str, memory_limit: int | None) -> tuple[bool, str]:
+    try:
+        return _unsafe_execute(code, memory_limit)
+    except Exception as e:
+        return False, f"failed: [{type(e).__name__}] {e}"
+
+
+# adapted from https://github.com/openai/human-eval/blob/6d43fb980f9fee3c892a914eda09951f772ad10d/human_eval/execution.py
+def _unsafe_execute(code: str, memory_limit: int | None) -> tuple[bool, str]:
+    # compiled up front, a syntax error is reported by run_code without
+    # creating the temp dir and setting up the sandbox; compiler warnings
+    # (e.g. SyntaxWarning) are swallowed like the rest of the sample's output
+    with swallow_io():
+        code_obj = compile(code, "<string>", "exec")
+
+    # Disable functionalities that can make destructive changes to the test.
+    # Normally already done when the runner started.
+    reliability_guard_once()
+    with create_tempdir():
+        # Convert MB to bytes
+        limit_bytes = int(memory_limit * 1024 * 1024) if memory_limit else None
+        reliability_guard_per_call(maximum_memory_bytes=limit_bytes)
+
+        try:
+            exec_globals = {}
+            with swallow_io():
+                # WARNING
+                # This program exists to execute untrusted model-generated code. Although
+                # it is highly unlikely that model-generated code will do something overtly
+                # malicious in response to this test suite, model-generated code may act
+                # destructively due to a lack of model capability or alignment.
+                # Users are strongly encouraged to sandbox this evaluation suite so that it
+                # does not perform destructive actions on their host or network. For more
+                # information on how OpenAI sandboxes its code, see the accompanying paper.
+                # Once you have read this disclaimer and taken appropriate precautions,
+                # uncomment the following line and proceed at your own risk:
+                exec(code_obj, exec_globals)
+            return True, ""
+        except BaseException as e:
+            return False, f"failed: [{type(e).__name__}] {e}"
+        finally:
+            # Needed for cleaning up.
+            shutil.rmtree = _rmtree
+            os.rmdir = _rmdir
+            os.unlink = _unlink
+            os.chdir = _chdir
+
+
+@contextlib.contextmanager
+def swallow_io():
+    stream = WriteOnlyStringIO()
+    # one swap of all three streams instead of three nested redirects
+    saved = sys.stdout, sys.stderr, sys.stdin
+    sys.stdout = sys.stderr = sys.stdin = stream
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr, sys.stdin = saved
+
+
+@contextlib.contextmanager
+def create_tempdir():
+    dirname = tempfile.mkdtemp()
+    try:
+        with chdir(dirname):
+            yield dirname
+    finally:
+        _remove_tempdir(dirname)
+
+
+def _remove_tempdir(dirname: str):
+    # most samples leave no files behind, so the directory is usually removed
+    # with a single rmdir instead of a shutil.rmtree walk
+    with contextlib.suppress(OSError):
+        with os.scandir(dirname) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    _rmtree(entry.path, ignore_errors=True)
+                else:
+                    _unlink(entry.path)
+        _rmdir(dirname)
+
+
+class WriteOnlyStringIO(io.StringIO):
+    """StringIO that throws an exception when it's read from"""
+
+    def read(self, *args, **kwargs):
+        raise IOError
+
+    def readline(self, *args, **kwargs):
+        raise IOError
+
+    def readlines(self, *args, **kwargs):
+        raise IOError
+
+    def readable(self, *args, **kwargs):
+        """Returns True if the IO object can be read."""
+        return False
+
+
+@contextlib.contextmanager
+def chdir(root):
+    if root == ".":
+        yield
+        return
+    cwd = _getcwd()
+    _chdir(root)
+    try:
+        yield
+    except BaseException as exc:
+        raise exc
+    finally:
+        _chdir(cwd)
+
+
+# runners inherit the server's environment and stderr; the code under test
+# decides how often a disabled function is called, so only report it when
+# debugging
+_REPORT_DISABLED = os.getenv("LOG_LEVEL", "INFO").upper() == "DEBUG"
+
+
+def _disabled(name: str, *_a, **_k):
+    if _REPORT_DISABLED:
+        print(f"disabled function: {name}", file=sys.__stderr__)
+
+
+def _resolve_disabled_targets() -> list[tuple[object, str, Callable]]:
+    import builtins
+    import subprocess
+
+    blocked = {
+        builtins: ["exit", "quit", "help"],
+        os: [
+            "kill",
+            "system",
+            "putenv",
+            "remove",
+            "removedirs",
+            "rmdir",
+            "fchdir",
+            "setuid",
+            "fork",
+            "forkpty",
+            "killpg",
+            "rename",
+            "renames",
+            "truncate",
+            "replace",
+            "unlink",
+            "fchmod",
+            "fchown",
+            "chmod",
+            "chown",
+            "chroot",
+            "lchflags",
+            "lchmod",
+            "lchown",
+            "getcwd",
+            "chdir",
+        ],
+        shutil: ["rmtree", "move", "chown"],
+        subprocess: ["Popen"],
+    }
+    return [
+        (module, name, functools.partial(_disabled, f"{module.__name__}.{name}"))
+        for module, names in blocked.items()
+        for name in names
+        if hasattr(module, name)
+    ]
+
+
+# resolved once at import, so that reliability_guard_once only has to assign them
+_DISABLED_TARGETS = _resolve_disabled_targets()
+_BLOCKED_MODULES = ("ipdb", "joblib", "resource", "psutil", "tkinter")
+
+# bound before the guard replaces them, the job still needs them to enter and
+# clean up its temporary directory
+_getcwd = os.getcwd
+_chdir = os.chdir
+_rmdir = os.rmdir
+_unlink = os.unlink
+_rmtree = shutil.rmtree
+
+_guard_applied = False
+
+
+def reliability_guard_once():
+    """
+    This disables various destructive functions and prevents the generated code
+    from interfering with the test (e.g. fork bomb, killing other processes,
+    removing filesystem files, etc.)
+
+    The changes persist for the rest of the process, so a runner applies them
+    once when it starts, before it is handed a job. Memory limits depend on the
+    job and are set by `reliability_guard_per_call`.
+
+    WARNING
+    This function is NOT a security sandbox. Untrusted code, including, model-
+    generated code, should not be blindly executed outside of one. See the
+    Codex paper for more information about OpenAI's code sandbox, and proceed
+    with caution.
+    """
+    global _guard_applied
+    if _guard_applied:
+        return
+    _guard_applied = True
+
+    # look up the temp directory now, tempfile probes it with os.unlink
+    tempfile.gettempdir()
+
+    faulthandler.disable()
+
+    os.environ["OMP_NUM_THREADS"] = "1"
+
+    for module, name, fn in _DISABLED_TARGETS:
+        setattr(module, name, fn)
+
+    for name in _BLOCKED_MODULES:
+        sys.modules[name] = None  # type: ignore[assignment]
+
+
+def reliability_guard_per_call(maximum_memory_bytes: int | None = None):
+    """Limit the memory of the job about to run, in bytes."""
+    if maximum_memory_bytes is not None:
+
+        def _safe_setrlimit(res, limit):
+            try:
+                _, hard = resource.getrlimit(res)
+                # If there is a hard limit, we cannot exceed it
+                if hard != resource.RLIM_INFINITY:
+                    limit = min(limit, hard)
+                resource.setrlimit(res, (limit, limit))
+            except (ValueError, OSError):
+                pass
+
+        _safe_setrlimit(resource.RLIMIT_AS, maximum_memory_bytes)
+        _safe_setrlimit(resource.RLIMIT_DATA, maximum_memory_bytes)
+
+        if sys.platform != "darwin":
+            _safe_setrlimit(resource.RLIMIT_STACK, maximum_memory_bytes)
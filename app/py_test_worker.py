@@ -0,0 +1,301 @@
+"""
+Test cases of python code, run inside the pooled runner processes.
+Only the standard library is imported here, to keep runner start-up short.
+"""
+
+import ast
+import builtins
+import itertools
+import json
+import sys
+from decimal import Decimal
+from io import StringIO
+from types import ModuleType
+from typing import Callable
+
+from .py_code_worker import reliability_guard_once, reliability_guard_per_call
+
+
+def run_test(
+    code: str,
+    inputs: list[str],
+    expect_outputs: list[str],
+    fn_name: str | None,
+    memory_limit: int | None,
+) -> tuple[bool, str]:
+    try:
+        return _unsafe_execute(code, inputs, expect_outputs, fn_name, memory_limit)
+    except Exception as e:
+        return False, f"failed: [{type(e).__name__}] {e}"
+
+
+def _unsafe_execute(
+    code: str,
+    inputs: list[str],
+    expect_outputs: list[str],
+    fn_name: str | None,
+    memory_limit: int | None,
+) -> tuple[bool, str]:
+    if len(inputs) != len(expect_outputs):
+        return False, "failed: number of inputs and outputs mismatch"
+
+    # Disable functionalities that can make destructive changes to the test.
+    # Normally already done when the runner started.
+    reliability_guard_once()
+    # memory_limit is in MB, convert to bytes
+    limit_bytes = int(memory_limit * 1024 * 1024) if memory_limit else None
+    reliability_guard_per_call(maximum_memory_bytes=limit_bytes)
+
+    if fn_name is not None:
+        compiled_sol = compile_code(code)
+        if compiled_sol is None:
+            return False, "failed: compile error"
+        fn = get_function(compiled_sol, fn_name)
+        if fn is None:
+            return False, "failed: no function defined"
+    else:
+        # parsed once, the rewritten tree is compiled without unparsing it
+        astree = ast.parse(code, "<string>")
+        astree = make_function(clean_if_name(astree))
+        compiled_sol = compile_code(astree)
+        if compiled_sol is None:
+            return False, "failed: compile error"
+        fn = get_function(compiled_sol, "wrapped_function")
+        if fn is None:
+            return False, "failed: no function defined"
+
+    for single_input, single_output in zip(inputs, expect_outputs):
+        if fn_name is not None:
+            ok, msg = _unsafe_execute_fn_call(fn, single_input, single_output)
+        else:
+            ok, msg = _unsafe_execute_stdio(fn, single_input, single_output)
+        if not ok:
+            return False, f"failed: {msg}"
+    return True, ""
+
+
+def _unsafe_execute_fn_call(
+    fn: Callable, single_input: str, expect_output: str
+) -> tuple[bool, str]:
+    try:
+        # args are parsed for every call since `fn` may mutate them
+        args = [json.loads(line) for line in single_input.split("\n")]
+        exp_outputs = json.loads(expect_output)
+
+        outputs = fn(*args)
+        # don't penalize model if it produces tuples instead of lists
+        # ground truth sequences are not tuples
+        if isinstance(outputs, tuple):
+            outputs = list(outputs)
+
+        if outputs != exp_outputs:
+            return False, f"output {outputs} != expect {exp_outputs}"
+        return True, ""
+    except Exception as e:
+        return False, f"[{type(e).__name__}] {e}"
+
+
+def _unsafe_execute_stdio(
+    method: Callable, single_input: str, expect_output: str
+) -> tuple[bool, str]:
+    with Capturing() as captured_output:
+        try:
+            call_method(method, single_input)
+        except Exception as e:
+            return False, f"[{type(e).__name__}] {e}"
+
+    output = captured_output[0]
+    # most accepted outputs match exactly, skip the line by line comparison
+    if output.strip() == expect_output.strip():
+        return True, ""
+
+    for out_line, exp_line in itertools.zip_longest(
+        iter_stripped_lines(output), iter_stripped_lines(expect_output)
+    ):
+        if out_line is None or exp_line is None:
+            return False, "output line count mismatch"
+        if out_line == exp_line:
+            continue
+
+        ok, out_decimals = convert_line_to_decimals(out_line)
+        if not ok:
+            return False, "output line is not all decimals"
+        ok, exp_decimals = convert_line_to_decimals(exp_line)
+        if not ok:
+            return False, "expect output line is not all decimals"
+        if out_decimals != exp_decimals:
+            return False, "output line decimals mismatch"
+
+    return True, ""
+
+
+# adapted from https://github.com/LiveCodeBench/LiveCodeBench/blob/28fef95ea8c9f7a547c8329f2cd3d32b92c1fa24/lcb_runner/evaluation/testing_util.py
+import_string = "from string import *\nfrom re import *\nfrom datetime import *\nfrom collections import *\nfrom heapq import *\nfrom bisect import *\nfrom copy import *\nfrom math import *\nfrom random import *\nfrom statistics import *\nfrom itertools import *\nfrom functools import *\nfrom operator import *\nfrom io import *\nfrom sys import *\nfrom json import *\nfrom builtins import *\nfrom typing import *\nimport string\nimport re\nimport datetime\nimport collections\nimport heapq\nimport bisect\nimport copy\nimport math\nimport random\nimport statistics\nimport itertools\nimport functools\nimport operator\nimport io\nimport sys\nimport json\nsys.setrecursionlimit(50000)\n"
+# the prelude does not depend on the code under test, so only compile it once
+_prelude_code = compile(import_string, "<prelude>", "exec")
+
+
+# used to capture stdout as a list
+# from https://stackoverflow.com/a/16571630/6416660
+# alternative use redirect_stdout() from contextlib
+class Capturing(list):
+    def __enter__(self):
+        self._stdout = sys.stdout
+        sys.stdout = self._stringio = StringIO()
+        # Make closing the StringIO a no-op
+        self._stringio.close = lambda x: 1
+        return self
+
+    def __exit__(self, *args):
+        self.append(self._stringio.getvalue())
+        del self._stringio  # free up some memory
+        sys.stdout = self._stdout
+
+
+# Custom mock for sys.stdin that supports buffer attribute, reads behave as in
+# the upstream harness: read() and readlines() see the whole input, without
+# a newline added to the last line
+class MockStdinWithBuffer:
+    def __init__(self, inputs: str):
+        self.inputs = inputs
+        self._stringio = StringIO(inputs)
+        self.buffer = MockBuffer(inputs)
+
+    def read(self, *args):
+        return self.inputs
+
+    def readline(self, *args):
+        return self._stringio.readline(*args)
+
+    def readlines(self, *args):
+        return self.inputs.split("\n")
+
+    def __getattr__(self, name):
+        # Delegate other attributes to StringIO
+        return getattr(self._stringio, name)
+
+
+class MockBuffer:
+    def __init__(self, inputs: str):
+        self.inputs = inputs.encode("utf-8")  # Convert to bytes
+
+    def read(self, *args):
+        # Return as byte strings that can be split
+        return self.inputs
+
+    def readline(self, *args):
+        return self.inputs.split(b"\n")[0] + b"\n"
+
+
+def clean_if_name(astree: ast.Module) -> ast.Module:
+    last_block = astree.body[-1] if astree.body else None
+    if isinstance(last_block, ast.If) and is_name_main_check(last_block.test):
+        astree.body = astree.body[:-1] + last_block.body
+    return astree
+
+
+def is_name_main_check(condition: ast.expr) -> bool:
+    # matches `__name__ == "__main__"` without unparsing the condition
+    return (
+        isinstance(condition, ast.Compare)
+        and isinstance(condition.left, ast.Name)
+        and condition.left.id == "__name__"
+        and len(condition.ops) == 1
+        and isinstance(condition.ops[0], ast.Eq)
+        and isinstance(condition.comparators[0], ast.Constant)
+        and condition.comparators[0].value == "__main__"
+    )
+
+
+def make_function(astree: ast.Module) -> ast.Module:
+    import_stmts = []
+    all_other_stmts = []
+    for stmt in astree.body:
+        if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            import_stmts.append(stmt)
+        else:
+            all_other_stmts.append(stmt)
+    if not all_other_stmts:
+        # nothing to wrap, a function without body does not compile
+        return astree
+
+    function_ast = ast.FunctionDef(
+        name="wrapped_function",
+        args=ast.arguments(
+            posonlyargs=[], args=[], kwonlyargs=[], kw_defaults=[], defaults=[]
+        ),
+        body=all_other_stmts,
+        decorator_list=[],
+        lineno=1,
+        col_offset=0,
+    )
+    # the wrapped statements keep their own line numbers
+    return ast.fix_missing_locations(
+        ast.Module(body=import_stmts + [function_ast], type_ignores=[])
+    )
+
+
+def call_method(method, inputs):
+    if isinstance(inputs, list):
+        inputs = "\n".join(inputs)
+
+    # feed inputs through stdin and any opened file
+    old_stdin, old_open = sys.stdin, builtins.open
+    sys.stdin = MockStdinWithBuffer(inputs)
+    builtins.open = lambda *args, **kwargs: StringIO(inputs)
+    try:
+        return method()
+    except SystemExit:
+        pass
+    finally:
+        sys.stdin, builtins.open = old_stdin, old_open
+
+
+def get_function(compiled_sol, fn_name: str):
+    try:
+        assert hasattr(compiled_sol, fn_name)
+        return getattr(compiled_sol, fn_name)
+    except Exception:
+        return
+
+
+def compile_code(code: str | ast.Module):
+    try:
+        tmp_sol = ModuleType("tmp_sol", "")
+        exec(_prelude_code, tmp_sol.__dict__)
+        exec(compile(code, "<string>", "exec"), tmp_sol.__dict__)
+        if isinstance(code, str) and "class Solution" in code:
+            # leetcode wraps solutions in `Solution`
+            # this is a hack to check if it is leetcode solution or not
+            # currently livecodebench only supports LeetCode but
+            # else condition allows future extensibility to other platforms
+            compiled_sol = tmp_sol.Solution()
+        else:
+            # do nothing in the other case since function is accesible
+            compiled_sol = tmp_sol
+
+        assert compiled_sol is not None
+    finally:
+        pass
+
+    return compiled_sol
+
+
+def convert_line_to_decimals(line: str) -> tuple[bool, list[Decimal]]:
+    try:
+        decimal_line = [Decimal(elem) for elem in line.split()]
+    except Exception:
+        return False, []
+    return True, decimal_line
+
+
+def iter_stripped_lines(val: str):
+    # you don't want empty lines to add empty list after splitlines!
+    val = val.strip()
+
+    # yield lines lazily, so that comparison stops at the first mismatch
+    start = 0
+    while (end := val.find("\n", start)) >= 0:
+        yield val[start:end].strip()
+        start = end + 1
+    yield val[start:].strip()
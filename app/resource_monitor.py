@@ -1,5 +1,6 @@
 import asyncio
 import contextlib
+import math
 from dataclasses import dataclass
 
 import psutil
@@ -13,54 +14,144 @@ class ResourceStats:
     peak_memory_mb: float = 0.0
 
 
-async def monitor_process_resources(
-    pid: int, interval: float = 0.1
-) -> tuple[ResourceStats, asyncio.Event]:
-    stats = ResourceStats()
-    stop_event = asyncio.Event()
+@dataclass
+class _Monitored:
+    process: psutil.Process
+    stats: ResourceStats
+    interval: float
+    due: float
+    active: bool = False
+    cpu_sum: float = 0.0
+    cpu_count: int = 0
+    memory_sum: float = 0.0
+    memory_count: int = 0
+
+
+class ResourceSampler:
+    """
+    Samples the CPU and memory usage of all registered processes from a single
+    task, instead of one task and timer per request.
 
-    cpu_samples = []
-    memory_samples = []
+    Each process is sampled at its own adaptive interval: it starts at
+    `base_interval` (seconds) and grows by half after each sample up to
+    `max_interval`, so short runs still get a few samples while long runs are
+    not polled needlessly often.
+    """
 
-    async def _monitor():
-        # If we can't monitor, just return zeros
-        with contextlib.suppress(Exception):
+    def __init__(self, base_interval: float = 0.01, max_interval: float = 0.2):
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self._monitored: dict[int, _Monitored] = {}
+        self._task: asyncio.Task | None = None
+        self._wakeup: asyncio.Event | None = None
+
+    def register(self, pid: int) -> ResourceStats:
+        """
+        Start sampling `pid`. The returned stats are final once `unregister`
+        has been called; if the process can't be monitored they stay zero.
+        """
+        stats = ResourceStats()
+        try:
             process = psutil.Process(pid)
-            # Initial CPU measurement (first call returns 0.0)
-            process.cpu_percent()
-
-            while not stop_event.is_set():
-                try:
-                    # Get CPU percentage (averaged over interval)
-                    cpu = process.cpu_percent()
-                    if cpu > 0:  # Skip initial 0 value
-                        cpu_samples.append(cpu)
-                        # Track peak CPU
-                        if cpu > stats.peak_cpu_percent:
-                            stats.peak_cpu_percent = cpu
-
-                    # Get memory usage in MB
-                    mem_info = process.memory_info()
-                    memory_mb = mem_info.rss / (1024 * 1024)
-                    memory_samples.append(memory_mb)
-
-                    # Track peak memory
-                    if memory_mb > stats.peak_memory_mb:
-                        stats.peak_memory_mb = memory_mb
-
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    # Process ended or we lost access
-                    break
-
-                await asyncio.sleep(interval)
-
-            # Calculate averages
-            if cpu_samples:
-                stats.cpu_percent = sum(cpu_samples) / len(cpu_samples)
-            if memory_samples:
-                stats.memory_mb = sum(memory_samples) / len(memory_samples)
-
-    # Start monitoring task
-    asyncio.create_task(_monitor())
-
-    return stats, stop_event
+            with process.oneshot():
+                # Initial CPU measurement (first call returns 0.0)
+                process.cpu_percent()
+                mem_info = process.memory_info()
+        except Exception:
+            return stats
+
+        loop = asyncio.get_running_loop()
+        monitored = _Monitored(
+            process=process,
+            stats=stats,
+            interval=self.base_interval,
+            due=loop.time() + self.base_interval,
+        )
+        # jobs may finish before the first interval, sample memory right away
+        self._add_memory(monitored, mem_info)
+        self._monitored[pid] = monitored
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        elif self._wakeup is not None:
+            self._wakeup.set()
+        return stats
+
+    def unregister(self, pid: int):
+        monitored = self._monitored.pop(pid, None)
+        if monitored is None:
+            return
+
+        # Calculate averages
+        stats = monitored.stats
+        if monitored.cpu_count:
+            stats.cpu_percent = monitored.cpu_sum / monitored.cpu_count
+        if monitored.memory_count:
+            stats.memory_mb = monitored.memory_sum / monitored.memory_count
+
+        if not self._monitored and self._wakeup is not None:
+            # let the sampling task finish
+            self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        wakeup = self._wakeup
+        assert wakeup is not None
+        while self._monitored:
+            now = loop.time()
+            for monitored in list(self._monitored.values()):
+                if monitored.due <= now:
+                    self._sample(monitored, now)
+
+            # sleep until the next process is due, or a new one is registered
+            due = min(m.due for m in self._monitored.values())
+            wakeup.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    wakeup.wait(),
+                    timeout=None if due == math.inf else max(0, due - loop.time()),
+                )
+
+    def _sample(self, monitored: _Monitored, now: float):
+        process, stats = monitored.process, monitored.stats
+        try:
+            # read all values of one sample together
+            with process.oneshot():
+                cpu = process.cpu_percent()
+                mem_info = process.memory_info()
+        except Exception:
+            # Process ended or we lost access, keep what was sampled so far
+            monitored.due = math.inf
+            return
+
+        # CPU percentage (averaged over interval)
+        if cpu > 0:  # Skip initial 0 value
+            monitored.cpu_sum += cpu
+            monitored.cpu_count += 1
+            # Track peak CPU
+            if cpu > stats.peak_cpu_percent:
+                stats.peak_cpu_percent = cpu
+            if not monitored.active:
+                # the process got busy, sample it closely again
+                monitored.active = True
+                monitored.interval = self.base_interval
+
+        self._add_memory(monitored, mem_info)
+
+        monitored.due = now + monitored.interval
+        monitored.interval = min(self.max_interval, monitored.interval * 1.5)
+
+    @staticmethod
+    def _add_memory(monitored: _Monitored, mem_info):
+        # memory usage in MB
+        memory_mb = mem_info.rss / (1024 * 1024)
+        monitored.memory_sum += memory_mb
+        monitored.memory_count += 1
+
+        # Track peak memory
+        stats = monitored.stats
+        if memory_mb > stats.peak_memory_mb:
+            stats.peak_memory_mb = memory_mb
+
+
+resource_sampler = ResourceSampler()
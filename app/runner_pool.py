@@ -0,0 +1,163 @@
+import asyncio
+import collections
+import contextlib
+import multiprocessing
+import os
+import sys
+import types
+from dataclasses import dataclass
+from multiprocessing import connection, process, shared_memory
+from typing import Callable
+
+from loguru import logger
+
+from .py_code_worker import reliability_guard_once
+from .resource_monitor import ResourceStats
+from .runner_worker import SharedMessage, runner_main
+from .utils import kill_proc_sync, recv_from_proc
+
+
+@dataclass
+class Runner:
+    process: process.BaseProcess
+    # one-way pipes: jobs go to the runner, results come back
+    job_writer: connection.Connection
+    result_reader: connection.Connection
+
+    def send(self, target: Callable[..., tuple[bool, str]], *args):
+        self.job_writer.send((target, args))
+
+    async def recv(self) -> tuple[bool, str, ResourceStats]:
+        """Receive the job's result, with the resources used by the runner."""
+        ok, msg, usage = await recv_from_proc(self.result_reader, self.process.pid)
+        if isinstance(msg, SharedMessage):
+            shm = shared_memory.SharedMemory(name=msg.name)
+            try:
+                msg = bytes(shm.buf[: msg.size]).decode("utf-8")
+            finally:
+                shm.close()
+                shm.unlink()
+        cpu_percent, rss_mb, hwm_mb = usage
+        return (
+            ok,
+            msg,
+            ResourceStats(
+                cpu_percent=cpu_percent,
+                peak_cpu_percent=cpu_percent,
+                memory_mb=rss_mb,
+                peak_memory_mb=hwm_mb,
+            ),
+        )
+
+    def close(self):
+        for conn in (self.job_writer, self.result_reader):
+            try:
+                conn.close()
+            except Exception:
+                logger.debug("failed to close runner connection")
+
+
+class RunnerPool:
+    """
+    Keeps a number of pre-started worker processes around, so that running a
+    sandboxed job does not pay the interpreter start-up on the request path.
+
+    A runner serves exactly one job: `reliability_guard_once` permanently
+    mutates the worker's interpreter, so a used runner is never handed out
+    again. Instead, replacements are started on the event loop right after a
+    runner is acquired, once the caller has sent its job, so that the pool
+    is back to `size` idle runners without delaying that job.
+
+    `initializer` is called in every runner after `preload` is imported and
+    before it waits for its job.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        preload: tuple[str, ...] = (),
+        initializer: Callable[[], None] | None = None,
+    ):
+        self.size = size
+        self.preload = preload
+        self.initializer = initializer
+        # runners are forked from a server process which has already imported
+        # the job modules, instead of starting an interpreter for each runner
+        self._ctx = multiprocessing.get_context("forkserver")
+        self._ctx.set_forkserver_preload([runner_main.__module__, *preload])
+        self._idle: collections.deque[Runner] = collections.deque()
+        self._refill_handle: asyncio.Handle | None = None
+
+    def start(self):
+        while len(self._idle) < self.size:
+            self._idle.append(self._spawn())
+
+    def acquire(self) -> Runner:
+        # drop runners which died while idle (e.g. killed by the OOM killer)
+        while self._idle and not self._idle[0].process.is_alive():
+            self._discard(self._idle.popleft())
+        runner = self._idle.popleft() if self._idle else self._spawn()
+        self._refill_soon()
+        return runner
+
+    def close(self):
+        if self._refill_handle is not None:
+            self._refill_handle.cancel()
+            self._refill_handle = None
+        while self._idle:
+            self._discard(self._idle.popleft())
+
+    def _refill_soon(self):
+        # p.start() waits for the forkserver, so one runner is started per
+        # iteration of the loop and other requests are served in between
+        if self._refill_handle is None:
+            self._refill_handle = asyncio.get_running_loop().call_soon(self._refill)
+
+    def _refill(self):
+        self._refill_handle = None
+        if len(self._idle) < self.size:
+            self._idle.append(self._spawn())
+            self._refill_soon()
+
+    def _spawn(self) -> Runner:
+        job_reader, job_writer = self._ctx.Pipe(duplex=False)
+        result_reader, result_writer = self._ctx.Pipe(duplex=False)
+        p = self._ctx.Process(
+            target=runner_main,
+            args=(job_reader, result_writer, self.preload, self.initializer),
+            daemon=True,
+        )
+        with _without_main_module():
+            p.start()
+        # only the child keeps its ends open, so that a dead child shows up as EOF
+        job_reader.close()
+        result_writer.close()
+        return Runner(process=p, job_writer=job_writer, result_reader=result_reader)
+
+    @staticmethod
+    def _discard(runner: Runner):
+        kill_proc_sync(runner.process)
+        runner.close()
+
+
+@contextlib.contextmanager
+def _without_main_module():
+    """
+    Hide the server's `__main__` while a runner is started. multiprocessing
+    would otherwise have every runner re-import the main script (e.g. the
+    `fastapi` CLI with typer, rich and uvicorn), although runners only need
+    `runner_main`, which is pickled by reference.
+    """
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+runner_pool = RunnerPool(
+    size=int(os.getenv("RUNNER_POOL_SIZE", os.cpu_count() or 1)),
+    preload=(f"{__package__}.py_code_worker", f"{__package__}.py_test_worker"),
+    initializer=reliability_guard_once,
+)
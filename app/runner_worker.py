@@ -0,0 +1,79 @@
+"""
+Code running inside the pooled runner processes.
+
+Runners are forked from the multiprocessing fork server, which imports this
+module and the job modules once. It sticks to the standard library, so that
+loguru, psutil and asyncio stay in the server process.
+"""
+
+import contextlib
+import importlib
+import time
+from multiprocessing import connection, shared_memory
+from typing import Callable, NamedTuple
+
+# result messages larger than this (in bytes) are passed through shared memory
+SHM_THRESHOLD = 64 * 1024
+
+
+class SharedMessage(NamedTuple):
+    name: str
+    size: int
+
+
+def runner_main(
+    job_reader: connection.Connection,
+    result_writer: connection.Connection,
+    preload: tuple[str, ...],
+    initializer: Callable[[], None] | None,
+):
+    for name in preload:
+        importlib.import_module(name)
+    if initializer is not None:
+        # done while the runner is idle, not on the job's time
+        initializer()
+    try:
+        target, args = job_reader.recv()
+    except EOFError:
+        # pool was closed before a job was assigned
+        return
+    started, cpu_started = _monotonic(), _process_time()
+    ok, msg = target(*args)
+    usage = _measure_usage(_monotonic() - started, _process_time() - cpu_started)
+    if len(msg) > SHM_THRESHOLD:
+        msg = _share_message(msg)
+    result_writer.send((ok, msg, usage))
+
+
+# bound at import, jobs may replace the module attributes while they run
+_monotonic = time.monotonic
+_process_time = time.process_time
+_open = open
+
+
+def _measure_usage(wall_time: float, cpu_time: float) -> tuple[float, float, float]:
+    """Return (cpu_percent, rss_mb, peak_rss_mb) of the runner."""
+    # a single reading once the job is done, instead of sampling it with psutil
+    cpu_percent = 100 * cpu_time / wall_time if wall_time > 0 else 0.0
+    rss_mb = hwm_mb = 0.0
+    with contextlib.suppress(OSError, ValueError):
+        with _open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss_mb = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    hwm_mb = int(line.split()[1]) / 1024
+    return cpu_percent, rss_mb, hwm_mb
+
+
+def _share_message(msg: str) -> str | SharedMessage:
+    # large messages (e.g. captured output) would otherwise be pickled and
+    # pushed through the pipe, blocking the event loop while it is received
+    try:
+        data = msg.encode("utf-8")
+        shm = shared_memory.SharedMemory(create=True, size=len(data))
+    except Exception:
+        return msg
+    shm.buf[: len(data)] = data
+    shm.close()
+    return SharedMessage(name=shm.name, size=len(data))
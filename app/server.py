@@ -1,9 +1,11 @@
 import atexit
+import functools
 import os
 import sys
-from typing import Any, Generic, TypeVar
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Generic, TypeVar
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from loguru import logger
 from pydantic import BaseModel
 
@@ -11,6 +13,10 @@ from .exec_js import execute_code as exec_js
 from .exec_py_code import execute_code as exec_py_code
 from .exec_py_test import execute_test as exec_py_test
 from .exec_ts import execute_code as exec_ts
+from .node_pool import node_pool, ts_node_pool
+from .resource_monitor import ResourceStats
+from .runner_pool import runner_pool
+from .utils import use_pidfd_child_watcher
 
 # logger
 logger.configure(
@@ -30,7 +36,21 @@ def exit_handler():
     logger.remove()
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    use_pidfd_child_watcher()
+    # start python runners and node workers before the first request arrives
+    runner_pool.start()
+    for pool in (node_pool, ts_node_pool):
+        if pool.enabled:
+            await pool.start()
+    yield
+    runner_pool.close()
+    await node_pool.close()
+    await ts_node_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 # Generic type for response data
@@ -72,97 +92,112 @@ class Sample(BaseModel):
     kwargs: dict[str, Any] | None = None
 
 
-@app.post("/evaluations")
-async def evaluate(sample: Sample) -> BasicResponse[ResourceMetrics]:
-    if sample.source in {"human-eval", "mbpp"}:
-        # 'human-eval' directly use the code
-        logger.debug(f"code to exec:\n{sample.code}")
-
-        CODE_EXECUTOR_MAP = {
-            "javascript": (exec_js, 3.0),
-            "python": (exec_py_code, 3.0),
-            "typescript": (exec_ts, 5.0),
-        }
-        if sample.lang in CODE_EXECUTOR_MAP:
-            fn, default_timeout = CODE_EXECUTOR_MAP[sample.lang]
-            timeout = sample.timeout if sample.timeout is not None else default_timeout
-            ok, msg, stats = await fn(
-                code=sample.code, timeout=timeout, memory_limit=sample.memory_limit
-            )
-        else:
-            ok, msg = False, f"not supported language: {sample.lang}"
-            stats = None
-
-        logger.info(
-            f"evaluate sample '{sample.uuid}' from '{sample.source}', "
-            f"language: {sample.lang}, timeout: {timeout}, memory_limit: {sample.memory_limit}, "
-            f"kwargs: {sample.kwargs}, status: {ok}, msg: {msg}, "
-            f"avg_cpu: {stats.cpu_percent if stats else 0:.2f}%, "
-            f"peak_cpu: {stats.peak_cpu_percent if stats else 0:.2f}%, "
-            f"avg_memory: {stats.memory_mb if stats else 0:.2f}MB, "
-            f"peak_memory: {stats.peak_memory_mb if stats else 0:.2f}MB"
-        )
-        return BasicResponse(
-            status=ok,
-            msg=msg,
-            data=(
-                ResourceMetrics(
-                    avg_cpu_percent=stats.cpu_percent,
-                    peak_cpu_percent=stats.peak_cpu_percent,
-                    avg_memory_mb=stats.memory_mb,
-                    peak_memory_mb=stats.peak_memory_mb,
-                )
-                if stats
-                else None
-            ),
-        )
-    elif sample.source == "livecodebench":
-        # 'livecodebench' use tests to eval the code
-        logger.debug(f"code to exec:\n{sample.code}")
+Result = tuple[bool, str, ResourceStats]
+# runs a sample, returns the timeout it was given and the result
+Executor = Callable[[Sample], Awaitable[tuple[float, Result]]]
 
-        if sample.lang != "python":
-            return BasicResponse(
-                status=False, msg=f"not supported language: {sample.lang}", data=None
-            )
 
-        if sample.test is None:
-            timeout = sample.timeout if sample.timeout is not None else 3.0
-            ok, msg, stats = await exec_py_code(
-                code=sample.code, timeout=timeout, memory_limit=sample.memory_limit
-            )
-        else:
-            default_timeout = 6.0 + len(sample.test.inputs) * 2.0
-            timeout = sample.timeout if sample.timeout is not None else default_timeout
-            ok, msg, stats = await exec_py_test(
-                code=sample.code,
-                inputs=sample.test.inputs,
-                expect_outputs=sample.test.outputs,
-                fn_name=sample.test.fn_name,
-                timeout=timeout,
-                memory_limit=sample.memory_limit,
-            )
+# formatted by loguru only when the message is actually logged
+_EVALUATED = (
+    "evaluate sample '{}' from '{}', "
+    "language: {}, timeout: {}, memory_limit: {}, "
+    "kwargs: {}, status: {}, msg: {}, "
+    "avg_cpu: {:.2f}%, "
+    "peak_cpu: {:.2f}%, "
+    "avg_memory: {:.2f}MB, "
+    "peak_memory: {:.2f}MB"
+)
+
 
-        logger.info(
-            f"evaluate sample '{sample.uuid}' from '{sample.source}', "
-            f"language: {sample.lang}, timeout: {timeout}, memory_limit: {sample.memory_limit}, "
-            f"kwargs: {sample.kwargs}, status: {ok}, msg: {msg}, "
-            f"avg_cpu: {stats.cpu_percent:.2f}%, "
-            f"peak_cpu: {stats.peak_cpu_percent:.2f}%, "
-            f"avg_memory: {stats.memory_mb:.2f}MB, "
-            f"peak_memory: {stats.peak_memory_mb:.2f}MB"
+async def _run_code(
+    sample: Sample, fn: Callable[..., Awaitable[Result]], default_timeout: float
+) -> tuple[float, Result]:
+    timeout = sample.timeout if sample.timeout is not None else default_timeout
+    return timeout, await fn(
+        code=sample.code, timeout=timeout, memory_limit=sample.memory_limit
+    )
+
+
+async def _run_livecodebench(sample: Sample) -> tuple[float, Result]:
+    # 'livecodebench' use tests to eval the code
+    if sample.test is None:
+        return await _run_code(sample, exec_py_code, 3.0)
+    default_timeout = 6.0 + len(sample.test.inputs) * 2.0
+    timeout = sample.timeout if sample.timeout is not None else default_timeout
+    return timeout, await exec_py_test(
+        code=sample.code,
+        inputs=sample.test.inputs,
+        expect_outputs=sample.test.outputs,
+        fn_name=sample.test.fn_name,
+        timeout=timeout,
+        memory_limit=sample.memory_limit,
+    )
+
+
+# executors by (source, lang), 'human-eval' and 'mbpp' directly use the code
+_DISPATCH: dict[tuple[str, str], Executor] = {
+    **{
+        (source, lang): functools.partial(
+            _run_code, fn=fn, default_timeout=default_timeout
         )
-        return BasicResponse(
-            status=ok,
-            msg=msg,
-            data=ResourceMetrics(
-                avg_cpu_percent=stats.cpu_percent,
-                peak_cpu_percent=stats.peak_cpu_percent,
-                avg_memory_mb=stats.memory_mb,
-                peak_memory_mb=stats.peak_memory_mb,
-            ),
+        for source in ("human-eval", "mbpp")
+        for lang, fn, default_timeout in (
+            ("javascript", exec_js, 3.0),
+            ("python", exec_py_code, 3.0),
+            ("typescript", exec_ts, 5.0),
         )
-    else:
-        logger.error(f"not supported data source: {sample.source}")
+    },
+    ("livecodebench", "python"): _run_livecodebench,
+}
+_SOURCES = frozenset(source for source, _ in _DISPATCH)
+
+
+# async, so that FastAPI doesn't run it in its thread pool
+async def get_executor(sample: Sample) -> Executor | None:
+    return _DISPATCH.get((sample.source, sample.lang))
+
+
+@app.post("/evaluations")
+async def evaluate(
+    sample: Sample, executor: Executor | None = Depends(get_executor)
+) -> BasicResponse[ResourceMetrics]:
+    if executor is None:
+        if sample.source not in _SOURCES:
+            logger.error(f"not supported data source: {sample.source}")
+            return BasicResponse(
+                status=False,
+                msg=f"not supported data source: {sample.source}",
+                data=None,
+            )
         return BasicResponse(
-            status=False, msg=f"not supported data source: {sample.source}", data=None
+            status=False, msg=f"not supported language: {sample.lang}", data=None
         )
+
+    logger.opt(lazy=True).debug("code to exec:\n{}", lambda: sample.code)
+    timeout, (ok, msg, stats) = await executor(sample)
+
+    logger.info(
+        _EVALUATED,
+        sample.uuid,
+        sample.source,
+        sample.lang,
+        timeout,
+        sample.memory_limit,
+        sample.kwargs,
+        ok,
+        msg,
+        stats.cpu_percent,
+        stats.peak_cpu_percent,
+        stats.memory_mb,
+        stats.peak_memory_mb,
+    )
+    return BasicResponse(
+        status=ok,
+        msg=msg,
+        data=ResourceMetrics(
+            avg_cpu_percent=stats.cpu_percent,
+            peak_cpu_percent=stats.peak_cpu_percent,
+            avg_memory_mb=stats.memory_mb,
+            peak_memory_mb=stats.peak_memory_mb,
+        ),
+    )
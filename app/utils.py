@@ -1,24 +1,182 @@
+import asyncio
+import contextlib
+import functools
 import os
 import signal
-from multiprocessing import process
+import sys
+from multiprocessing import connection, process
 
 from loguru import logger
 
 
-def kill_proc(p: process.BaseProcess):
+async def kill_proc(p: process.BaseProcess):
+    """Like `kill_proc_sync`, but waits for the subprocess on the event loop."""
+    if not p:
+        return
+    if p.is_alive():
+        p.terminate()
+        await _wait_exit(p, 0.1)
+    if p.is_alive():
+        _sigkill(p)
+        await _wait_exit(p, 0.1)
+    _close(p)
+
+
+def kill_proc_sync(p: process.BaseProcess):
     if not p:
         return
     if p.is_alive():
         p.terminate()
         p.join(0.1)
     if p.is_alive():
-        try:
-            if p.pid is not None:
-                os.kill(p.pid, signal.SIGKILL)
-        except Exception:
-            logger.debug(f"failed to kill subprocess: {p.pid}")
+        _sigkill(p)
         p.join(0.1)
+    _close(p)
+
+
+async def _wait_exit(p: process.BaseProcess, timeout: float):
+    # the sentinel becomes readable once the subprocess has exited
+    with contextlib.suppress(asyncio.TimeoutError):
+        await asyncio.wait_for(wait_readable(p.sentinel), timeout=timeout)
+
+
+def _sigkill(p: process.BaseProcess):
+    try:
+        if p.pid is not None:
+            os.kill(p.pid, signal.SIGKILL)
+    except Exception:
+        logger.debug(f"failed to kill subprocess: {p.pid}")
+
+
+def _close(p: process.BaseProcess):
     try:
         p.close()
     except Exception:
         logger.debug(f"failed to close subprocess: {p.pid}")
+
+
+async def wait_readable(*fds: int):
+    """Wait on the event loop until any of the given file descriptors is readable."""
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+
+    def _on_ready():
+        if not ready.done():
+            ready.set_result(None)
+
+    for fd in fds:
+        loop.add_reader(fd, _on_ready)
+    try:
+        await ready
+    finally:
+        for fd in fds:
+            loop.remove_reader(fd)
+
+
+# taken once, instead of copying os.environ for every subprocess
+_BASE_ENV = dict(os.environ)
+
+
+@functools.lru_cache(maxsize=32)
+def node_env(memory_limit: int | None) -> dict[str, str]:
+    """
+    Environment for node subprocesses, with the heap limited to `memory_limit`
+    MB. The returned dict is shared between calls and must not be modified.
+    """
+    if not memory_limit:
+        return _BASE_ENV
+    return {**_BASE_ENV, "NODE_OPTIONS": f"--max-old-space-size={memory_limit}"}
+
+
+def kill_process_group(proc: asyncio.subprocess.Process):
+    """
+    SIGKILL `proc` together with the processes it started. `proc` has to be
+    started with `start_new_session=True` for them to share its group.
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        # not a group leader, or its whole group is gone already
+        with contextlib.suppress(ProcessLookupError):
+            proc.kill()
+    except PermissionError:
+        logger.debug(f"failed to kill process group: {proc.pid}")
+
+
+# output a subprocess may write to stdout or stderr before it is killed
+MAX_OUTPUT_BYTES = 8 * 1024 * 1024
+
+
+async def communicate_capped(
+    proc: asyncio.subprocess.Process, input: bytes, limit: int = MAX_OUTPUT_BYTES
+) -> tuple[bytes | None, bytes | None]:
+    """
+    Like `proc.communicate(input)`, but kills the subprocess as soon as stdout
+    or stderr grows past `limit` bytes. That stream is returned as None.
+    """
+    assert proc.stdin is not None
+    assert proc.stdout is not None and proc.stderr is not None
+
+    async def _feed():
+        with contextlib.suppress(BrokenPipeError, ConnectionResetError):
+            proc.stdin.write(input)
+            await proc.stdin.drain()
+        proc.stdin.close()
+
+    async def _read(stream: asyncio.StreamReader) -> bytes | None:
+        data = bytearray()
+        while chunk := await stream.read(64 * 1024):
+            data += chunk
+            if len(data) > limit:
+                # also ends the other stream, which would otherwise stay open
+                kill_process_group(proc)
+                return None
+        return bytes(data)
+
+    _, stdout, stderr = await asyncio.gather(
+        _feed(), _read(proc.stdout), _read(proc.stderr)
+    )
+    await proc.wait()
+    return stdout, stderr
+
+
+async def recv_from_proc(conn: connection.Connection, pid: int | None):
+    """
+    Receive a message sent by the subprocess `pid`, waking up as soon as a
+    message arrives or the subprocess exits. Raises `EOFError` if the
+    subprocess exited without sending anything.
+    """
+    if pid is None or not hasattr(os, "pidfd_open"):
+        return await asyncio.to_thread(conn.recv)
+    try:
+        pidfd = os.pidfd_open(pid)
+    except OSError:
+        # kernel without pidfd support (< 5.3), or the subprocess is already gone
+        return await asyncio.to_thread(conn.recv)
+    try:
+        await wait_readable(conn.fileno(), pidfd)
+    finally:
+        os.close(pidfd)
+    return conn.recv()
+
+
+def use_pidfd_child_watcher():
+    """
+    Make asyncio wait for subprocesses (node, ts-node) through pidfds instead of
+    its default watcher, which blocks one thread in waitpid() per child.
+    Python >= 3.12 already does this, and loops which handle children
+    themselves (e.g. uvloop) are left alone.
+    """
+    if sys.version_info >= (3, 12) or not hasattr(os, "pidfd_open"):
+        return
+    loop = asyncio.get_running_loop()
+    if not isinstance(loop, asyncio.SelectorEventLoop):
+        return
+    try:
+        # kernels < 5.3 have no pidfd_open
+        os.close(os.pidfd_open(os.getpid()))
+    except OSError:
+        return
+    watcher = asyncio.PidfdChildWatcher()
+    watcher.attach_loop(loop)
+    asyncio.set_child_watcher(watcher)